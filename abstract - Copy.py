@@ -1,8 +1,15 @@
 #!/usr/bin/env python3
 import os
+import orjson
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from web3 import Web3
 from web3.exceptions import Web3RPCError
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from eth_utils import to_checksum_address
 
 # ─── CONFIG ─────────────────────────────────────────────────────
 # Use a public Ethereum RPC endpoint (no key required):
@@ -14,42 +21,92 @@ START_BLOCK   = 0
 # Output files
 HOLDERS_FILE  = "holders.txt"
 COUNT_FILE    = "count.txt"
+# How many block-windows to pack into one JSON-RPC batch request
+BATCH_SIZE    = 20
+# How many batch requests to keep in flight at once
+MAX_WORKERS   = 16
 # ────────────────────────────────────────────────────────────────
 
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=MAX_WORKERS, pool_maxsize=MAX_WORKERS * 2,
+    max_retries=Retry(total=3, backoff_factor=0.3,
+                      status_forcelist=(429, 500, 502, 503),
+                      allowed_methods=None)))
+
+@lru_cache(maxsize=None)
+def checksum(addr_bytes):
+    """EIP-55 checksum a 20-byte address; repeats are a cache hit."""
+    return to_checksum_address(addr_bytes)
+
+def post_rpc_batch(rpc_url, method, params_list):
+    """POST several JSON-RPC calls as one batch; return the raw response
+    objects ordered to match `params_list`."""
+    payload = [
+        {"jsonrpc": "2.0", "method": method, "params": params, "id": i}
+        for i, params in enumerate(params_list)
+    ]
+    resp = SESSION.post(rpc_url, data=orjson.dumps(payload),
+                        headers={"Content-Type": "application/json"},
+                        timeout=30)
+    resp.raise_for_status()
+    by_id = {r["id"]: r for r in orjson.loads(resp.content)}
+    return [by_id[i] for i in range(len(params_list))]
+
+
 def fetch_logs_in_chunks(w3, address, topic, start, end):
     """
     Fetch all logs for `topic` at `address` between blocks [start..end],
-    automatically reducing the block-chunk size if the node returns
-    "more than 10000 results" errors.
+    packing many block-windows into each JSON-RPC request and splitting
+    any window that trips the node's "more than 10000 results" limit.
     """
-    logs = []
-    current = start
+    rpc_url = w3.provider.endpoint_uri
     chunk = 100_000
-
-    while current <= end:
-        to_block = min(current + chunk - 1, end)
-        try:
-            batch = w3.eth.get_logs({
-                "fromBlock": current,
-                "toBlock":   to_block,
-                "address":   address,
-                "topics":    [topic],
-            })
-            logs.extend(batch)
-            current = to_block + 1
-        except Web3RPCError as e:
-            msg = str(e)
-            if "more than" in msg:
-                chunk = max(chunk // 2, 1)
-                print(f"⚠️ Reducing chunk size to {chunk} blocks (error: {msg})")
+    pending = [(frm, min(frm + chunk - 1, end))
+               for frm in range(start, end + 1, chunk)]
+    windows = []
+
+    def fetch_batch(batch):
+        replies = post_rpc_batch(rpc_url, "eth_getLogs", [
+            [{"fromBlock": hex(frm), "toBlock": hex(to),
+              "address": address, "topics": [topic]}]
+            for frm, to in batch
+        ])
+        done, resplit = [], []
+        for (frm, to), reply in zip(batch, replies):
+            if "error" in reply:
+                msg = reply["error"].get("message", "")
+                if "more than" in msg and frm < to:
+                    mid = (frm + to) // 2
+                    resplit += [(frm, mid), (mid + 1, to)]
+                    print(f"⚠️ Splitting window {frm}-{to} (error: {msg})")
+                else:
+                    raise Web3RPCError(f"eth_getLogs failed for {frm}-{to}: {msg}")
             else:
-                raise
+                done.append((frm, reply["result"]))
+        return done, resplit
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        while pending:
+            batches = [pending[i:i + BATCH_SIZE]
+                       for i in range(0, len(pending), BATCH_SIZE)]
+            pending = []
+            for done, resplit in pool.map(fetch_batch, batches):
+                windows.extend(done)
+                pending.extend(resplit)
+
+    logs = []
+    for _, batch_logs in sorted(windows):
+        logs.extend(batch_logs)
     return logs
 
 
 def main():
     # Connect to Ethereum mainnet via Cloudflare (or override via RPC_URL env var)
-    w3 = Web3(Web3.HTTPProvider(RPC_URL))
+    # Reuse the batch SESSION for the provider too, so every call
+    # shares one keep-alive pool
+    w3 = Web3(Web3.HTTPProvider(RPC_URL, request_kwargs={"timeout": 30},
+                                session=SESSION))
     if not w3.is_connected():
         raise RuntimeError(f"❌ Could not connect to RPC at {RPC_URL!r}")
 
@@ -61,16 +118,17 @@ def main():
     logs = fetch_logs_in_chunks(w3, addr, transfer_topic, START_BLOCK, latest)
     print(f"⚡ Retrieved {len(logs)} Transfer events in total\n")
 
+    ZERO = b"\x00" * 20
     token_owner = {}
     holders = defaultdict(set)
 
     for log in logs:
         _, from_t, to_t, id_t = log["topics"]
-        frm = w3.to_checksum_address("0x" + from_t.hex()[-40:])
-        to  = w3.to_checksum_address("0x" + to_t.hex()[-40:])
-        tid = int(id_t.hex(), 16)
+        frm = bytes.fromhex(from_t[-40:])
+        to  = bytes.fromhex(to_t[-40:])
+        tid = int(id_t, 16)
 
-        if frm != "0x0000000000000000000000000000000000000000":
+        if frm != ZERO:
             if token_owner.get(tid) == frm:
                 holders[frm].discard(tid)
 
@@ -80,10 +138,10 @@ def main():
     result = [addr for addr, toks in holders.items() if toks]
     count  = len(result)
 
-    # Write holder addresses
+    # Write holder addresses sorted by raw bytes; each address is only
+    # checksummed once here instead of twice per event above
     with open(HOLDERS_FILE, "w") as f:
-        for h in sorted(result):
-            f.write(h + "\n")
+        f.write("\n".join(checksum(h) for h in sorted(result)) + "\n")
     print(f"📄 Saved {count} addresses to '{HOLDERS_FILE}'")
 
     # Write the tally
@@ -1,8 +1,16 @@
 #!/usr/bin/env python3
 import os
+import pickle
+import orjson
+import requests
+import numpy as np
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from web3 import Web3
 from web3.exceptions import Web3RPCError
-from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from eth_utils import to_checksum_address
 
 # ─── CONFIG ─────────────────────────────────────────────────────
 RPC_URL        = os.getenv("RPC_URL", "https://api.mainnet.abs.xyz")
@@ -10,80 +18,155 @@ CONTRACT_ADDR  = "0xee7d1b184be8185adc7052635329152a4d0cdefa"
 START_BLOCK    = 0     # set to your contract’s creation block if known
 HOLDERS_FILE   = "holders.txt"
 COUNT_FILE     = "count.txt"
+STATE_FILE     = "abstract_state.pkl"   # resumable {tid: owner} snapshot
+BATCH_SIZE     = 20    # block-windows per JSON-RPC batch request
+MAX_WORKERS    = 16    # concurrent batch requests in flight
 # ────────────────────────────────────────────────────────────────
 
+SESSION = requests.Session()  # keep-alive across every batch POST
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=MAX_WORKERS, pool_maxsize=MAX_WORKERS * 2,
+    max_retries=Retry(total=3, backoff_factor=0.3,
+                      status_forcelist=(429, 500, 502, 503),
+                      allowed_methods=None)))
+
+@lru_cache(maxsize=None)
+def checksum(addr_bytes):
+    """EIP-55 checksum a 20-byte address; repeat addresses are a cache hit.
+    Calls eth_utils directly, skipping web3's validation layer."""
+    return to_checksum_address(addr_bytes)
+
+def post_rpc_batch(rpc_url, method, params_list):
+    """POST several JSON-RPC calls as one batch; return the raw response
+    objects ordered to match `params_list`."""
+    payload = [
+        {"jsonrpc": "2.0", "method": method, "params": params, "id": i}
+        for i, params in enumerate(params_list)
+    ]
+    resp = SESSION.post(rpc_url, data=orjson.dumps(payload),
+                        headers={"Content-Type": "application/json"},
+                        timeout=30)
+    resp.raise_for_status()
+    by_id = {r["id"]: r for r in orjson.loads(resp.content)}
+    return [by_id[i] for i in range(len(params_list))]
+
+
 def fetch_logs_in_chunks(w3, address, topic, start, end):
     """
     Fetch all logs for `topic` at `address` between blocks [start..end],
-    automatically reducing the block‑chunk size if Abstract returns
-    “more than 10000 results” errors.
+    batching many block‑windows into one JSON‑RPC request so the scan is
+    not serialized on per‑window round‑trips. Windows that trip Abstract's
+    “more than 10000 results” limit are cut in half and re‑queued.
     """
-    logs = []
-    current = start
-    chunk = 100_000  # initial block‑window size; will shrink on errors
-
-    while current <= end:
-        to_block = min(current + chunk - 1, end)
-        try:
-            batch = w3.eth.get_logs({
-                "fromBlock": current,
-                "toBlock":   to_block,
-                "address":   address,
-                "topics":    [topic],
-            })
-            logs.extend(batch)
-            current = to_block + 1
-        except Web3RPCError as e:
-            msg = str(e)
-            if "more than" in msg:
-                # too many logs in this window: cut it in half and retry
-                chunk = max(chunk // 2, 1)
-                print(f"⚠️  Reducing chunk size to {chunk} blocks (error: {msg})")
+    rpc_url = w3.provider.endpoint_uri
+    chunk = 100_000  # initial block‑window size; dense windows get split
+    pending = [(frm, min(frm + chunk - 1, end))
+               for frm in range(start, end + 1, chunk)]
+    windows = []
+
+    def fetch_batch(batch):
+        """Fetch one batch of windows; return (done, resplit)."""
+        replies = post_rpc_batch(rpc_url, "eth_getLogs", [
+            [{"fromBlock": hex(frm), "toBlock": hex(to),
+              "address": address, "topics": [topic]}]
+            for frm, to in batch
+        ])
+        done, resplit = [], []
+        for (frm, to), reply in zip(batch, replies):
+            if "error" in reply:
+                msg = reply["error"].get("message", "")
+                if "more than" in msg and frm < to:
+                    mid = (frm + to) // 2
+                    resplit += [(frm, mid), (mid + 1, to)]
+                    print(f"⚠️  Splitting window {frm}-{to} (error: {msg})")
+                else:
+                    raise Web3RPCError(f"eth_getLogs failed for {frm}-{to}: {msg}")
             else:
-                raise
+                done.append((frm, reply["result"]))
+        return done, resplit
+
+    # Keep several batch requests in flight at once; windows that needed a
+    # split are re-queued for the next round.
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        while pending:
+            batches = [pending[i:i + BATCH_SIZE]
+                       for i in range(0, len(pending), BATCH_SIZE)]
+            pending = []
+            for done, resplit in pool.map(fetch_batch, batches):
+                windows.extend(done)
+                pending.extend(resplit)
+
+    # flatten in block order so transfer ordering is preserved
+    logs = []
+    for _, batch_logs in sorted(windows):
+        logs.extend(batch_logs)
     return logs
 
 
+def load_state():
+    """Load the {tid: 20-byte owner} snapshot from the previous run, if
+    any, so we only have to scan blocks produced since then."""
+    if os.path.exists(STATE_FILE):
+        with open(STATE_FILE, "rb") as f:
+            state = pickle.load(f)
+        print(f"♻️  Resuming from block {state['last_block']+1} "
+              f"({len(state['owners'])} tokens in snapshot)")
+        return state["owners"], state["last_block"] + 1
+    return {}, START_BLOCK
+
+
+def save_state(owners, last_block):
+    tmp = STATE_FILE + ".tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump({"owners": owners, "last_block": last_block}, f,
+                    protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, STATE_FILE)   # atomic: never leaves a torn snapshot
+
+
 def main():
-    w3 = Web3(Web3.HTTPProvider(RPC_URL))
+    # Reuse the batch SESSION for the provider too, so every call
+    # shares one keep-alive pool
+    w3 = Web3(Web3.HTTPProvider(RPC_URL, request_kwargs={"timeout": 30},
+                                session=SESSION))
     if not w3.is_connected():
         raise RuntimeError(f"❌ Could not connect to RPC at {RPC_URL!r}")
 
     addr = w3.to_checksum_address(CONTRACT_ADDR)
     transfer_topic = w3.keccak(text="Transfer(address,address,uint256)").hex()
 
+    token_owner, start = load_state()
     latest = w3.eth.block_number
-    print(f"🔍 Scanning Transfer events from block {START_BLOCK} to {latest}…")
-    logs = fetch_logs_in_chunks(w3, addr, transfer_topic, START_BLOCK, latest)
+    print(f"🔍 Scanning Transfer events from block {start} to {latest}…")
+    logs = fetch_logs_in_chunks(w3, addr, transfer_topic, start, latest)
     print(f"⚡ Retrieved {len(logs)} Transfer events in total\n")
 
-    # Map token → current owner, and owner → set of tokens
-    token_owner = {}
-    holders = defaultdict(set)
+    # Vectorized last-transfer-wins reduction: the final owner of each
+    # token is simply the `to` of its latest Transfer, so the per-event
+    # dict/set bookkeeping collapses into a few NumPy array passes.
+    n = len(logs)
+    if n:
+        to_a = np.frombuffer(
+            b"".join(bytes.fromhex(l["topics"][2][-40:]) for l in logs),
+            dtype=np.uint8).reshape(n, 20)
+        tids = np.fromiter((int(l["topics"][3], 16) for l in logs),
+                           dtype=np.uint64, count=n)
 
-    for log in logs:
-        _, from_t, to_t, id_t = log["topics"]
-        frm   = w3.to_checksum_address("0x" + from_t.hex()[-40:])
-        to    = w3.to_checksum_address("0x" + to_t.hex()[-40:])
-        tid   = int(id_t.hex(), 16)
+        # index of the last event per token id (logs are in chain order)
+        last_idx = n - 1 - np.unique(tids[::-1], return_index=True)[1]
 
-        # remove from previous owner (unless mint)
-        if frm != "0x0000000000000000000000000000000000000000":
-            if token_owner.get(tid) == frm:
-                holders[frm].discard(tid)
+        # fold this run's result into the snapshot from previous runs
+        for tid, row in zip(tids[last_idx], to_a[last_idx]):
+            token_owner[int(tid)] = row.tobytes()
 
-        # assign to new owner
-        token_owner[tid] = to
-        holders[to].add(tid)
+    save_state(token_owner, latest)
 
-    # Collect only addresses with at least one token
-    result = [addr for addr, toks in holders.items() if toks]
-    count = len(result)
+    ZERO = b"\x00" * 20
+    holders = sorted({o for o in token_owner.values() if o != ZERO})
+    count = len(holders)
 
-    # Save holders to file
+    # Save holders to file (checksum each address once, single buffered write)
     with open(HOLDERS_FILE, "w") as f:
-        for h in sorted(result):
-            f.write(h + "\n")
+        f.write("\n".join(checksum(h) for h in holders) + "\n")
     print(f"📄 Saved {count} addresses to '{HOLDERS_FILE}'")
 
     # Save count to file
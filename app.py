@@ -1,13 +1,41 @@
 from flask import Flask, render_template, request, jsonify
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
+import orjson
 from web3 import Web3
+from web3.exceptions import ContractLogicError, BadFunctionCallOutput
+import hashlib
 import os
+import re
 from supabase import create_client, Client
+from supabase.lib.client_options import ClientOptions
 from datetime import datetime, timedelta
 import logging
+import threading
+import time
+import numpy as np
 import requests  # Added for hCaptcha verification
+from cachetools import TTLCache
+
+try:
+    import redis
+except ImportError:  # optional; only needed for multi-worker shared caching
+    redis = None
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+class OrjsonProvider(JSONProvider):
+    """Route every jsonify/request.get_json through orjson's C encoder;
+    the integer-heavy token lists serialize several times faster than
+    with the stdlib module."""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
 
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 CORS(app, resources={r"/api/*": {"origins": ["https://www.mymilio.xyz", "http://localhost:3000"]}})
 
 # Set up logging
@@ -17,7 +45,21 @@ logger = logging.getLogger(__name__)
 # —— CONFIG ——  
 RPC_URL = os.getenv("RPC_URL", "https://api.mainnet.abs.xyz")
 HCAPTCHA_SECRET = os.getenv("HCAPTCHA_SECRET")  # Already set in Render
-w3 = Web3(Web3.HTTPProvider(RPC_URL))
+
+# One keep-alive session backs both the web3 provider and the raw batch
+# helper, so TCP/TLS setup is paid once per pooled connection instead of
+# per call. The pool is sized for the thread counts used below.
+# JSON-RPC reads are idempotent, so transient faults retry at the
+# transport layer (allowed_methods=None covers POST) with backoff
+# instead of surfacing as 500s.
+RPC_SESSION = requests.Session()
+RPC_SESSION.mount("https://", requests.adapters.HTTPAdapter(
+    pool_connections=20, pool_maxsize=100,
+    max_retries=requests.adapters.Retry(
+        total=3, backoff_factor=0.3,
+        status_forcelist=(429, 500, 502, 503), allowed_methods=None)))
+w3 = Web3(Web3.HTTPProvider(RPC_URL, request_kwargs={"timeout": 30},
+                            session=RPC_SESSION))
 if not w3.is_connected():
     logger.error("Failed to connect to Abstract RPC")
     raise RuntimeError("❌ Could not connect to Abstract RPC")
@@ -25,14 +67,49 @@ if not w3.is_connected():
 # Supabase setup
 SUPABASE_URL = os.getenv("SUPABASE_URL", "https://vkxchgckwyqnxlmirqqu.supabase.co")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# A bounded query timeout keeps one stuck Postgres call from pinning a
+# request thread for the default (much longer) httpx timeout; the client
+# itself is process-wide so its connection pool stays warm.
+supabase: Client = create_client(
+    SUPABASE_URL, SUPABASE_KEY,
+    options=ClientOptions(postgrest_client_timeout=10))
+
+# Small worker pool for overlapping independent Supabase round-trips
+_db_pool = ThreadPoolExecutor(max_workers=4)
+
+# Optional Redis-backed cache shared across gunicorn workers; without
+# REDIS_URL each worker falls back to its own in-process TTL cache.
+_redis = None
+if redis is not None and os.getenv("REDIS_URL"):
+    try:
+        _redis = redis.Redis.from_url(os.getenv("REDIS_URL"),
+                                      socket_timeout=1, socket_connect_timeout=1)
+        _redis.ping()
+        logger.info("Using Redis for shared token caching")
+    except Exception as e:
+        logger.warning(f"Redis unavailable ({e}); using per-process cache only")
+        _redis = None
 
 # SketchyMilio contract
 CONTRACT_ADDRESS = Web3.to_checksum_address("0x08533A2b16e3db03eeBD5b23210122f97dfcb97d")
 
+# Compiled once; the length guard rejects the common garbage input before
+# the regex state machine even runs
+_ADDR_RE = re.compile(r'^0x[a-fA-F0-9]{40}$')
+
+def validate_address(address):
+    """Cheap shape check before the keccak-based checksum conversion."""
+    if len(address) != 42 or not _ADDR_RE.match(address):
+        raise ValueError(f"Invalid address: {address}")
+    return address
+
 # Event signatures
-TRANSFER_SIG = w3.keccak(text="Transfer(address,address,uint256)").hex()
-CONS_SIG = w3.keccak(text="ConsecutiveTransfer(uint256,uint256,address,address)").hex()
+# Well-known event signature hashes as literals (keccak of
+# "Transfer(address,address,uint256)" and the ERC-2309
+# "ConsecutiveTransfer(uint256,uint256,address,address)"); test.py
+# recomputes them to guard against typos.
+TRANSFER_SIG = "0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"
+CONS_SIG = "0xdeaa91b6123d068f5821d0fb0678463d1a8a6079fe8af5de3ce5e896dcf9133d"
 
 # Minimal ERC-721 Enumerable ABI
 ERC721_ENUM_ABI = [
@@ -42,6 +119,58 @@ ERC721_ENUM_ABI = [
      "name": "tokenOfOwnerByIndex", "outputs": [{"name": "", "type": "uint256"}], "type": "function"}
 ]
 
+# First block to scan: set via env when known, else discovered once by
+# binary-searching eth_getCode (~25 calls) so log scans never walk the
+# empty pre-deployment range.
+CONTRACT_DEPLOY_BLOCK = int(os.getenv("CONTRACT_DEPLOY_BLOCK", "0"))
+
+def _deploy_block():
+    global CONTRACT_DEPLOY_BLOCK
+    if CONTRACT_DEPLOY_BLOCK == 0:
+        lo, hi = 0, w3.eth.block_number
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if w3.eth.get_code(CONTRACT_ADDRESS, block_identifier=mid) == b"":
+                lo = mid + 1
+            else:
+                hi = mid
+        CONTRACT_DEPLOY_BLOCK = lo
+        logger.info(f"Found contract deployment at block {lo}")
+    return CONTRACT_DEPLOY_BLOCK
+
+# Contract object and 4-byte selectors built once at import; the hot
+# enumeration path then assembles calldata by concatenating bytes
+# instead of going through web3's ABI codec per call.
+CONTRACT = w3.eth.contract(address=CONTRACT_ADDRESS, abi=ERC721_ENUM_ABI)
+SEL_BALANCEOF = Web3.keccak(text="balanceOf(address)")[:4]
+SEL_TOKEN_BY_INDEX = Web3.keccak(text="tokenOfOwnerByIndex(address,uint256)")[:4]
+
+# Multicall3 (same address on every chain): folds a whole page of
+# per-index reads into one eth_call.
+MULTICALL3_ADDRESS = Web3.to_checksum_address("0xcA11bde05977b3631167028862bE2a173976CA11")
+MULTICALL3_ABI = [
+    {"name": "aggregate", "type": "function", "stateMutability": "view",
+     "inputs": [{"name": "calls", "type": "tuple[]",
+                 "components": [{"name": "target", "type": "address"},
+                                {"name": "callData", "type": "bytes"}]}],
+     "outputs": [{"name": "blockNumber", "type": "uint256"},
+                 {"name": "returnData", "type": "bytes[]"}]}
+]
+MULTICALL3 = w3.eth.contract(address=MULTICALL3_ADDRESS, abi=MULTICALL3_ABI)
+
+# Keep-alive session for hCaptcha verification round-trips
+HCAPTCHA_SESSION = requests.Session()
+
+def submit_hcaptcha_check():
+    """Kick off verification of the current request's captcha token on
+    the db pool; returns the future, or None when no token was sent.
+    Callers overlap it with their RPC work and check the result before
+    returning anything."""
+    response_token = request.form.get("h-captcha-response")
+    if not response_token:
+        return None
+    return _db_pool.submit(verify_hcaptcha, response_token)
+
 def verify_hcaptcha(response_token):
     """Verify hCaptcha response token with hCaptcha API."""
     if not HCAPTCHA_SECRET:
@@ -49,12 +178,13 @@ def verify_hcaptcha(response_token):
         return False
 
     try:
-        response = requests.post(
+        response = HCAPTCHA_SESSION.post(
             "https://hcaptcha.com/siteverify",
             data={
                 "response": response_token,
                 "secret": HCAPTCHA_SECRET
-            }
+            },
+            timeout=10
         )
         result = response.json()
         success = result.get("success", False)
@@ -65,245 +195,433 @@ def verify_hcaptcha(response_token):
         logger.error(f"Error verifying hCaptcha: {e}")
         return False
 
-def fetch_via_enumeration(c_addr, owner):
-    c = w3.eth.contract(address=c_addr, abi=ERC721_ENUM_ABI)
-    bal = c.functions.balanceOf(owner).call()
-    return [c.functions.tokenOfOwnerByIndex(owner, i).call() for i in range(bal)]
-
-def fetch_via_logs(c_addr, owner, start_block=0, chunk=100_000):
-    owner_lc = owner.lower()
-    latest = w3.eth.block_number
-    myset = set()
-
-    for frm in range(start_block, latest+1, chunk):
-        to = min(frm+chunk-1, latest)
-        logs = w3.eth.get_logs({
-            "fromBlock": frm, "toBlock": to,
-            "address": c_addr, "topics": [None]
-        })
-
-        for ev in logs:
-            sig = ev["topics"][0].hex()
-            if sig == TRANSFER_SIG:
-                frm_a = "0x"+ev["topics"][1].hex()[-40:]
-                to_a = "0x"+ev["topics"][2].hex()[-40:]
-                tid = int.from_bytes(ev["topics"][3], "big")
-                if to_a.lower() == owner_lc:
-                    myset.add(tid)
-                if frm_a.lower() == owner_lc:
-                    myset.discard(tid)
-            elif sig == CONS_SIG:
-                ft = int(ev["topics"][1].hex(), 16)
-                tt = int(ev["topics"][2].hex(), 16)
-                fa = "0x"+ev["topics"][3].hex()[-40:]
-                ta = "0x"+ev["data"].hex()[-40:]
-                if ta.lower() == owner_lc:
-                    myset.update(range(ft, tt+1))
-                if fa.lower() == owner_lc:
-                    for x in range(ft, tt+1):
-                        myset.discard(x)
-
-    return sorted(myset)
+LOG_BATCH_SIZE = 20
+CALL_BATCH_SIZE = 500
+
+def _post_rpc_batch(method, params_list):
+    """POST several JSON-RPC calls as one batch request.
+
+    Returns the raw response objects ordered to match `params_list`.
+    """
+    payload = [
+        {"jsonrpc": "2.0", "method": method, "params": params, "id": i}
+        for i, params in enumerate(params_list)
+    ]
+    # orjson on both sides: the get_logs replies are hex-heavy and can
+    # run to megabytes, where the C parser is several times faster
+    resp = RPC_SESSION.post(RPC_URL, data=orjson.dumps(payload),
+                            headers={"Content-Type": "application/json"},
+                            timeout=30)
+    resp.raise_for_status()
+    by_id = {r["id"]: r for r in orjson.loads(resp.content)}
+    return [by_id[i] for i in range(len(params_list))]
 
-def fetch_my_tokens(c_addr, owner):
+def fetch_via_enumeration(c_addr, owner):
+    owner_32 = bytes(12) + bytes.fromhex(owner[2:])
+    bal = int.from_bytes(
+        w3.eth.call({"to": c_addr, "data": SEL_BALANCEOF + owner_32}), "big")
+    if bal == 0:
+        return []
+
+    # Calldata is selector + padded owner + index, built by concatenation;
+    # batches are capped so a whale wallet can't produce a payload the
+    # provider rejects.
+    calldatas = [SEL_TOKEN_BY_INDEX + owner_32 + i.to_bytes(32, "big")
+                 for i in range(bal)]
+
+    # Preferred: one Multicall3 aggregate per page — a single eth_call
+    # returns every token id for that page.
     try:
-        return fetch_via_enumeration(c_addr, owner)
+        tokens = []
+        for off in range(0, len(calldatas), CALL_BATCH_SIZE):
+            _, ret = MULTICALL3.functions.aggregate(
+                [(c_addr, cd) for cd in calldatas[off:off+CALL_BATCH_SIZE]]).call()
+            tokens.extend(int.from_bytes(rd, "big") for rd in ret)
+        return tokens
+    except ContractLogicError:
+        # A revert means the contract lacks tokenOfOwnerByIndex; let the
+        # probe's sentinel see it rather than retrying per index.
+        raise
     except Exception as e:
-        logger.warning(f"Enumeration failed: {e}. Falling back to logs.")
-        return fetch_via_logs(c_addr, owner)
-
-@app.route("/", methods=["GET", "POST"])
-def index():
-    error = None
-    user_toks = None
-
-    if request.method == "POST":
-        raw_o = request.form["owner"].strip()
+        logger.warning(f"Multicall3 aggregate failed ({e}); using batched eth_call")
+
+    # Fallback: one batched JSON-RPC entry per index.
+    calls = [[{"to": c_addr, "data": "0x" + cd.hex()}, "latest"]
+             for cd in calldatas]
+    tokens = []
+    for off in range(0, len(calls), CALL_BATCH_SIZE):
+        for reply in _post_rpc_batch("eth_call", calls[off:off+CALL_BATCH_SIZE]):
+            if "error" in reply:
+                err = reply["error"]
+                if "revert" in str(err.get("message", "")).lower():
+                    raise ContractLogicError(f"eth_call reverted: {err}")
+                raise RuntimeError(f"eth_call failed: {err}")
+            tokens.append(int(reply["result"], 16))
+    return tokens
+
+LOG_SCAN_WORKERS = 8  # concurrent batch requests; stays under public RPC limits
+REORG_DEPTH = 12      # blocks re-scanned on resume in case the tip reorged
+
+def _fetch_log_windows(start_block, latest, topics=None, chunk=100_000):
+    """Fetch contract logs in [start_block..latest] via batched
+    eth_getLogs requests, several batches in flight at once; returns
+    them flattened in block order."""
+    pending = [(frm, min(frm+chunk-1, latest))
+               for frm in range(start_block, latest+1, chunk)]
+    windows = []
+
+    def fetch_batch(batch):
+        """Fetch one batch of windows; return (done, resplit)."""
         try:
-            o = Web3.to_checksum_address(raw_o)
-            user_toks = fetch_my_tokens(CONTRACT_ADDRESS, o)
-        except Exception as e:
-            logger.error(f"Error fetching tokens: {e}")
-            error = f"🚨 {e}"
-
-    return render_template("index.html",
-                           error=error,
-                           user_toks=user_toks)
-
-@app.route("/api/tokenss", methods=["POST"])
-def get_tokens():
+            replies = _post_rpc_batch("eth_getLogs", [
+                [{"fromBlock": hex(frm), "toBlock": hex(to),
+                  "address": CONTRACT_ADDRESS,
+                  "topics": topics or [[TRANSFER_SIG, CONS_SIG]]}]
+                for frm, to in batch
+            ])
+        except requests.RequestException as e:
+            # Timeout / 429 / oversized response kills the whole batch
+            # without telling us which window tripped it: halve them all
+            # and re-queue rather than giving up on the scan.
+            if not any(frm < to for frm, to in batch):
+                raise
+            logger.warning(f"get_logs batch failed ({e}); halving {len(batch)} windows")
+            resplit = []
+            for frm, to in batch:
+                if frm < to:
+                    mid = (frm + to) // 2
+                    resplit += [(frm, mid), (mid+1, to)]
+                else:
+                    resplit.append((frm, to))
+            return [], resplit
+        done, resplit = [], []
+        for (frm, to), reply in zip(batch, replies):
+            if "error" in reply:
+                msg = reply["error"].get("message", "")
+                if "more than" in msg and frm < to:
+                    mid = (frm + to) // 2
+                    resplit += [(frm, mid), (mid+1, to)]
+                    logger.warning(f"Splitting get_logs window {frm}-{to}: {msg}")
+                else:
+                    raise RuntimeError(f"eth_getLogs failed for {frm}-{to}: {msg}")
+            else:
+                done.append((frm, reply["result"]))
+        return done, resplit
+
+    with ThreadPoolExecutor(max_workers=LOG_SCAN_WORKERS) as pool:
+        while pending:
+            batches = [pending[i:i+LOG_BATCH_SIZE]
+                       for i in range(0, len(pending), LOG_BATCH_SIZE)]
+            pending = []
+            for done, resplit in pool.map(fetch_batch, batches):
+                windows.extend(done)
+                pending.extend(resplit)
+
+    # Fold in window order so same-token transfers replay in chain order.
+    logs = []
+    for _, batch_logs in sorted(windows):
+        logs.extend(batch_logs)
+    return logs
+
+# —— Incremental scan state ——
+# The full-chain log scan is amortized across requests: we keep a
+# token -> owner map plus the last scanned block, persisted to the
+# scan_state table so a restart doesn't go back to genesis.
+_scan_lock = threading.Lock()
+_token_owner = None   # dict[int, str]: token id -> lowercase owner address
+_last_scanned = -1
+
+def _load_scan_state():
+    global _token_owner, _last_scanned
     try:
-        # Verify hCaptcha
-        hcaptcha_response = request.form.get("h-captcha-response")
-        if not hcaptcha_response or not verify_hcaptcha(hcaptcha_response):
-            logger.warning("hCaptcha verification failed")
-            return jsonify({"tokens": None, "error": "Invalid hCaptcha response"}), 400
-
-        owner = Web3.to_checksum_address(request.form["owner"].strip())
-        tokens = fetch_my_tokens(CONTRACT_ADDRESS, owner)
-        logger.info(f"Fetched {len(tokens)} tokens for address {owner}")
-        return jsonify({"tokens": tokens, "error": None})
+        result = supabase.table("scan_state").select("last_block, token_owner") \
+            .eq("contract", CONTRACT_ADDRESS.lower()).execute()
+        if result.data:
+            _last_scanned = result.data[0]["last_block"]
+            _token_owner = {int(k): v for k, v in result.data[0]["token_owner"].items()}
+            logger.info(f"Loaded scan state at block {_last_scanned} ({len(_token_owner)} tokens)")
+            return
     except Exception as e:
-        logger.error(f"Error in get_tokens: {e}")
-        return jsonify({"tokens": None, "error": str(e)}), 400
+        logger.warning(f"Could not load scan state: {e}")
+    _token_owner = {}
+    _last_scanned = -1
 
-@app.route("/api/claim_pointss", methods=["POST"])
-def claim_points():
+def _save_scan_state():
     try:
-        # Verify hCaptcha
-        hcaptcha_response = request.form.get("h-captcha-response")
-        if not hcaptcha_response or not verify_hcaptcha(hcaptcha_response):
-            logger.warning("hCaptcha verification failed")
-            return jsonify({"success": False, "error": "Invalid hCaptcha response"}), 400
-
-        owner = Web3.to_checksum_address(request.form["owner"].strip())
-        logger.info(f"Processing claim for address {owner}")
-
-        # Fetch all tokens owned
-        tokens = fetch_my_tokens(CONTRACT_ADDRESS, owner)
-        if not tokens:
-            logger.warning(f"No tokens owned by {owner}")
-            return jsonify({"success": False, "error": "No tokens owned"}), 400
-
-        # Validate token IDs (ensure they are between 1 and 4269)
-        tokens = [t for t in tokens if 1 <= t <= 4269]
-        if not tokens:
-            logger.warning(f"No valid tokens (1-4269) owned by {owner}")
-            return jsonify({"success": False, "error": "No valid tokens (1-4269) owned"}), 400
-
-        # Check last claim time for each token
-        claimable_tokens = []
-        claimed_tokens = supabase.table("token_claims").select("token_id, claimed_at").in_("token_id", tokens).execute()
-        claimed_dict = {row["token_id"]: datetime.fromisoformat(row["claimed_at"].replace("Z", "+00:00")) for row in claimed_tokens.data}
-
-        for token in tokens:
-            last_claim_time = claimed_dict.get(token)
-            if not last_claim_time or last_claim_time + timedelta(hours=24) <= datetime.now().astimezone():
-                claimable_tokens.append(token)
-
-        # Calculate points for claimable tokens
-        points = len(claimable_tokens) *遵
-
-System: You are Grok 3 built by xAI.
-
-The code was cut off at the end, but I can provide the complete updated version with hCaptcha integration for both `/api/tokenss` and `/api/claim_pointss` endpoints, ensuring the code is fully functional. Below is the complete Flask backend code with the hCaptcha verification logic included, continuing from where the previous response was truncated. I've also included the necessary imports and ensured the code aligns with your existing setup on Render.
-
-### Complete Updated Backend Code
-
-```python
-from flask import Flask, render_template, request, jsonify
-from flask_cors import CORS
-from web3 import Web3
-import os
-from supabase import create_client, Client
-from datetime import datetime, timedelta
-import logging
-import requests  # Added for hCaptcha verification
-
-app = Flask(__name__)
-CORS(app, resources={r"/api/*": {"origins": ["https://www.mymilio.xyz", "http://localhost:3000"]}})
-
-# Set up logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
-
-# —— CONFIG ——  
-RPC_URL = os.getenv("RPC_URL", "https://api.mainnet.abs.xyz")
-HCAPTCHA_SECRET = os.getenv("HCAPTCHA_SECRET")  # Already set in Render
-w3 = Web3(Web3.HTTPProvider(RPC_URL))
-if not w3.is_connected():
-    logger.error("Failed to connect to Abstract RPC")
-    raise RuntimeError("❌ Could not connect to Abstract RPC")
-
-# Supabase setup
-SUPABASE_URL = os.getenv("SUPABASE_URL", "https://vkxchgckwyqnxlmirqqu.supabase.co")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-
-# SketchyMilio contract
-CONTRACT_ADDRESS = Web3.to_checksum_address("0x08533A2b16e3db03eeBD5b23210122f97dfcb97d")
-
-# Event signatures
-TRANSFER_SIG = w3.keccak(text="Transfer(address,address,uint256)").hex()
-CONS_SIG = w3.keccak(text="ConsecutiveTransfer(uint256,uint256,address,address)").hex()
-
-# Minimal ERC-721 Enumerable ABI
-ERC721_ENUM_ABI = [
-    {"constant": True, "inputs": [{"name": "_owner", "type": "address"}],
-     "name": "balanceOf", "outputs": [{"name": "", "type": "uint256"}], "type": "function"},
-    {"constant": True, "inputs": [{"name": "_owner", "type": "address"}, {"name": "_index", "type": "uint256"}],
-     "name": "tokenOfOwnerByIndex", "outputs": [{"name": "", "type": "uint256"}], "type": "function"}
-]
-
-def verify_hcaptcha(response_token):
-    """Verify hCaptcha response token with hCaptcha API."""
-    if not HCAPTCHA_SECRET:
-        logger.error("HCAPTCHA_SECRET not set")
-        return False
-
-    try:
-        response = requests.post(
-            "https://hcaptcha.com/siteverify",
-            data={
-                "response": response_token,
-                "secret": HCAPTCHA_SECRET
-            }
-        )
-        result = response.json()
-        success = result.get("success", False)
-        if not success:
-            logger.warning(f"hCaptcha verification failed: {result.get('error-codes', 'Unknown error')}")
-        return success
+        supabase.table("scan_state").upsert({
+            "contract": CONTRACT_ADDRESS.lower(),
+            "last_block": _last_scanned,
+            "token_owner": {str(k): v for k, v in _token_owner.items()},
+        }).execute()
     except Exception as e:
-        logger.error(f"Error verifying hCaptcha: {e}")
-        return False
+        logger.warning(f"Could not persist scan state: {e}")
 
-def fetch_via_enumeration(c_addr, owner):
-    c = w3.eth.contract(address=c_addr, abi=ERC721_ENUM_ABI)
-    bal = c.functions.balanceOf(owner).call()
-    return [c.functions.tokenOfOwnerByIndex(owner, i).call() for i in range(bal)]
+def _refresh_owner_map():
+    """Scan only the blocks added since the checkpoint and fold their
+    transfers into the owner map. Caller must hold _scan_lock."""
+    global _last_scanned
+    if _token_owner is None:
+        _load_scan_state()
 
-def fetch_via_logs(c_addr, owner, start_block=0, chunk=100_000):
+    latest = w3.eth.block_number
+    if latest <= _last_scanned:
+        return
+
+    start = _last_scanned + 1 if _last_scanned >= 0 else _deploy_block()
+
+    # OR-filter on topic0 so the node only ships the two event kinds we
+    # dispatch on, not the contract's full event stream. Globals used per
+    # event are bound to locals ahead of the loop.
+    tsig, csig, owner_map = TRANSFER_SIG, CONS_SIG, _token_owner
+    events = _fetch_log_windows(start, latest, topics=[[tsig, csig]])
+
+    if events and all(ev["topics"][0] == tsig for ev in events):
+        # Pure Transfer stream (the common case outside mint batches):
+        # the final owner of each token is the `to` of its last event,
+        # so reduce last-transfer-wins in NumPy and only touch the dict
+        # once per distinct token instead of once per event.
+        n = len(events)
+        tids = np.fromiter((int(ev["topics"][3][-8:], 16) for ev in events),
+                           dtype=np.uint64, count=n)
+        last_idx = n - 1 - np.unique(tids[::-1], return_index=True)[1]
+        for i in last_idx:
+            owner_map[int(tids[i])] = "0x"+events[i]["topics"][2][-40:]
+    else:
+        # ConsecutiveTransfer ranges interleave with single transfers;
+        # replay in chain order.
+        for ev in events:
+            t = ev["topics"]
+            sig = t[0]
+            if sig == tsig:
+                owner_map[int(t[3][-8:], 16)] = "0x"+t[2][-40:]
+            elif sig == csig:
+                ft = int(t[1][-8:], 16)
+                tt = int(t[2][-8:], 16)
+                ta = "0x"+ev["data"][-40:]
+                for tid in range(ft, tt+1):
+                    owner_map[tid] = ta
+
+    _last_scanned = latest
+    _save_scan_state()
+
+def _sorted_token_list(token_ids):
+    """Sort a collection of token ids via a contiguous uint64 array;
+    plain ints reappear only at the JSON boundary."""
+    arr = np.fromiter(token_ids, dtype=np.uint64, count=len(token_ids))
+    arr.sort()
+    return arr.tolist()
+
+def _owner_topic(owner_lc):
+    """Left-pad an address to the 32-byte word eth_getLogs topic filters
+    expect: 12 zero bytes + the 20 address bytes (test.py asserts the
+    width)."""
+    return "0x" + "00"*12 + owner_lc[2:]
+
+def fetch_owner_tokens_via_topics(c_addr, owner, start_block=None):
+    """Per-owner log scan that lets the node filter Transfer events by the
+    indexed from/to topics instead of shipping every event to us.
+
+    ConsecutiveTransfer recipients live in the data field and can't be
+    topic-filtered, so those events are fetched separately (they only
+    occur for mint batches).
+    """
     owner_lc = owner.lower()
+    seed_tokens = []
+    if start_block is None:
+        start_block = _deploy_block()
+        # Resume from this owner's checkpoint (see sql/token_cache.sql)
+        # instead of replaying their whole history every cold fetch.
+        try:
+            cached = supabase.table("token_cache").select("last_block, tokens") \
+                .eq("address", owner_lc).execute()
+            if cached.data:
+                start_block = max(start_block, cached.data[0]["last_block"] + 1)
+                seed_tokens = cached.data[0]["tokens"] or []
+        except Exception as e:
+            logger.warning(f"token_cache unavailable: {e}")
+    owner_topic = _owner_topic(owner_lc)
     latest = w3.eth.block_number
-    myset = set()
-
-    for frm in range(start_block, latest+1, chunk):
-        to = min(frm+chunk-1, latest)
-        logs = w3.eth.get_logs({
-            "fromBlock": frm, "toBlock": to,
-            "address": c_addr, "topics": [None]
-        })
-
-        for ev in logs:
-            sig = ev["topics"][0].hex()
-            if sig == TRANSFER_SIG:
-                frm_a = "0x"+ev["topics"][1].hex()[-40:]
-                to_a = "0x"+ev["topics"][2].hex()[-40:]
-                tid = int.from_bytes(ev["topics"][3], "big")
-                if to_a.lower() == owner_lc:
-                    myset.add(tid)
-                if frm_a.lower() == owner_lc:
-                    myset.discard(tid)
-            elif sig == CONS_SIG:
-                ft = int(ev["topics"][1].hex(), 16)
-                tt = int(ev["topics"][2].hex(), 16)
-                fa = "0x"+ev["topics"][3].hex()[-40:]
-                ta = "0x"+ev["data"].hex()[-40:]
-                if ta.lower() == owner_lc:
-                    myset.update(range(ft, tt+1))
-                if fa.lower() == owner_lc:
-                    for x in range(ft, tt+1):
-                        myset.discard(x)
-
-    return sorted(myset)
 
-def fetch_my_tokens(c_addr, owner):
+    incoming = _fetch_log_windows(start_block, latest, [TRANSFER_SIG, None, owner_topic])
+    outgoing = _fetch_log_windows(start_block, latest, [TRANSFER_SIG, owner_topic])
+    cons = _fetch_log_windows(start_block, latest, [CONS_SIG])
+
+    # Merge the three streams back into chain order (dedupe self-transfers
+    # that show up as both incoming and outgoing).
+    seen = set()
+    merged = []
+    for ev in incoming + outgoing + cons:
+        key = (int(ev["blockNumber"], 16), int(ev["logIndex"], 16))
+        if key in seen:
+            continue
+        seen.add(key)
+        merged.append((key, ev))
+    merged.sort()
+
+    # Compare raw 40-char address tails against the precomputed owner tail
+    # instead of building "0x…" strings (or checksumming) per event. The
+    # owned set is a bigint bitmask (bit i = token i) so a batch-mint
+    # range is one shift-and-or instead of a Python loop over its ids.
+    owner_tail = owner_lc[2:]
+    tsig, csig = TRANSFER_SIG, CONS_SIG
+    mask = 0
+    for tid in seed_tokens:
+        mask |= 1 << tid
+    for _, ev in merged:
+        t = ev["topics"]
+        sig = t[0]
+        if sig == tsig:
+            tid = int(t[3][-8:], 16)
+            if t[2][-40:] == owner_tail:
+                mask |= 1 << tid
+            if t[1][-40:] == owner_tail:
+                mask &= ~(1 << tid)
+        elif sig == csig:
+            ft = int(t[1][-8:], 16)
+            tt = int(t[2][-8:], 16)
+            rng = ((1 << (tt - ft + 1)) - 1) << ft
+            if ev["data"][-40:] == owner_tail:
+                mask |= rng
+            if t[3][-40:] == owner_tail:
+                mask &= ~rng
+
+    # Pop set bits lowest-first, so the result is already sorted.
+    tokens = []
+    while mask:
+        lsb = mask & -mask
+        tokens.append(lsb.bit_length() - 1)
+        mask ^= lsb
+
+    # Checkpoint a reorg-depth behind the tip; the overlap is replayed
+    # on the next scan, which is idempotent over the seeded set.
     try:
-        return fetch_via_enumeration(c_addr, owner)
+        supabase.table("token_cache").upsert({
+            "address": owner_lc,
+            "last_block": max(start_block - 1, latest - REORG_DEPTH),
+            "tokens": tokens,
+        }).execute()
     except Exception as e:
-        logger.warning(f"Enumeration failed: {e}. Falling back to logs.")
-        return fetch_via_logs(c_addr, owner)
+        logger.warning(f"Could not checkpoint token_cache for {owner_lc}: {e}")
+    return tokens
+
+_bootstrap_started = False
+
+def _ensure_scan_bootstrap():
+    """Build the shared owner map once in the background so cold-cache
+    requests don't block on the full history scan."""
+    global _bootstrap_started
+    if _bootstrap_started:
+        return
+    _bootstrap_started = True
+
+    def bootstrap():
+        with _scan_lock:
+            try:
+                _refresh_owner_map()
+            except Exception as e:
+                logger.error(f"Owner-map bootstrap failed: {e}")
+
+    threading.Thread(target=bootstrap, daemon=True).start()
+
+def fetch_via_logs(c_addr, owner):
+    """Answer an ownership query from the incrementally maintained owner
+    map when it is warm; fall back to a per-owner topic-filtered scan
+    while the map is cold or busy."""
+    owner_lc = owner.lower()
+    if _scan_lock.acquire(blocking=False):
+        try:
+            if _token_owner is None:
+                _load_scan_state()
+            if _last_scanned >= 0:
+                _refresh_owner_map()
+                return _sorted_token_list(
+                    [tid for tid, o in _token_owner.items() if o == owner_lc])
+        finally:
+            _scan_lock.release()
+        _ensure_scan_bootstrap()
+    return fetch_owner_tokens_via_topics(c_addr, owner)
+
+# Short-lived result cache so retries / back-to-back endpoint hits don't
+# redo the whole fetch. Keying on block_number // 10 auto-invalidates the
+# entry every ~10 blocks even within the TTL window.
+_tokens_cache = TTLCache(maxsize=10_000, ttl=30)
+_tokens_cache_lock = threading.Lock()
+
+# Pool for racing the two fetch strategies against each other
+_fetch_pool = ThreadPoolExecutor(max_workers=8)
+
+# None until the first enumeration attempt settles it; a revert means the
+# contract simply lacks ERC721Enumerable, which never changes, so later
+# requests skip the doomed probe entirely.
+_enum_supported = None
+
+def _fetch_via_enumeration_probed(c_addr, owner):
+    global _enum_supported
+    try:
+        tokens = fetch_via_enumeration(c_addr, owner)
+    except (ContractLogicError, BadFunctionCallOutput):
+        _enum_supported = False
+        raise
+    _enum_supported = True
+    return tokens
+
+def fetch_my_tokens(c_addr, owner):
+    key = (c_addr, owner, w3.eth.block_number // 10)
+    with _tokens_cache_lock:
+        cached = _tokens_cache.get(key)
+    if cached is not None:
+        return cached
+
+    if _redis is not None:
+        try:
+            shared = _redis.get(f"tok:{owner.lower()}")
+            if shared is not None:
+                return orjson.loads(shared)
+        except Exception as e:
+            logger.warning(f"Redis read failed: {e}")
+
+    # Hedge: launch enumeration and the log scan together and take the
+    # first clean result, so an unsupported/slow enumeration no longer
+    # adds its full latency in front of the fallback.
+    futures = [_fetch_pool.submit(fetch_via_logs, c_addr, owner)]
+    if _enum_supported is not False:
+        futures.append(_fetch_pool.submit(_fetch_via_enumeration_probed, c_addr, owner))
+    pending = set(futures)
+    tokens = None
+    last_err = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for f in done:
+            err = f.exception()
+            if err is None:
+                tokens = f.result()
+                pending = set()
+                break
+            logger.warning(f"Token fetch strategy failed: {err}")
+            last_err = err
+    if tokens is None:
+        raise last_err
+
+    with _tokens_cache_lock:
+        _tokens_cache[key] = tokens
+    if _redis is not None:
+        try:
+            _redis.setex(f"tok:{owner.lower()}", 30, orjson.dumps(tokens))
+        except Exception as e:
+            logger.warning(f"Redis write failed: {e}")
+    return tokens
+
+def _invalidate_tokens_cache(owner):
+    """Drop any cached results for `owner` so the next fetch re-reads the
+    chain (e.g. right after a claim touched their state)."""
+    with _tokens_cache_lock:
+        for key in [k for k in _tokens_cache if k[1] == owner]:
+            del _tokens_cache[key]
+    if _redis is not None:
+        try:
+            _redis.delete(f"tok:{owner.lower()}")
+        except Exception as e:
+            logger.warning(f"Redis delete failed: {e}")
 
 @app.route("/", methods=["GET", "POST"])
 def index():
@@ -313,7 +631,7 @@ def index():
     if request.method == "POST":
         raw_o = request.form["owner"].strip()
         try:
-            o = Web3.to_checksum_address(raw_o)
+            o = Web3.to_checksum_address(validate_address(raw_o))
             user_toks = fetch_my_tokens(CONTRACT_ADDRESS, o)
         except Exception as e:
             logger.error(f"Error fetching tokens: {e}")
@@ -326,16 +644,26 @@ def index():
 @app.route("/api/tokenss", methods=["POST"])
 def get_tokens():
     try:
-        # Verify hCaptcha
-        hcaptcha_response = request.form.get("h-captcha-response")
-        if not hcaptcha_response or not verify_hcaptcha(hcaptcha_response):
-            logger.warning("hCaptcha verification failed")
-            return jsonify({"tokens": None, "error": "Invalid hCaptcha response"}), 400
+        owner = Web3.to_checksum_address(validate_address(request.form["owner"].strip()))
 
-        owner = Web3.to_checksum_address(request.form["owner"].strip())
+        # Verify hCaptcha while the (slower) token fetch runs on this
+        # thread; on the rare failure the fetched result is just dropped
+        captcha_future = submit_hcaptcha_check()
         tokens = fetch_my_tokens(CONTRACT_ADDRESS, owner)
+
+        if captcha_future is None or not captcha_future.result():
+            logger.warning("hCaptcha verification failed")
+            return jsonify({"tokens": None, "error": "Invalid hCaptcha response"}), 400
         logger.info(f"Fetched {len(tokens)} tokens for address {owner}")
-        return jsonify({"tokens": tokens, "error": None})
+        # Unchanged holdings hash to the same ETag, so a repeat caller
+        # gets an empty 304 instead of the full list again
+        etag = hashlib.md5(repr(tokens).encode()).hexdigest()
+        if etag in request.if_none_match:
+            return "", 304
+        resp = jsonify({"tokens": tokens, "error": None})
+        resp.set_etag(etag)
+        resp.headers["Cache-Control"] = "private, max-age=30"
+        return resp
     except Exception as e:
         logger.error(f"Error in get_tokens: {e}")
         return jsonify({"tokens": None, "error": str(e)}), 400
@@ -343,36 +671,76 @@ def get_tokens():
 @app.route("/api/claim_pointss", methods=["POST"])
 def claim_points():
     try:
-        # Verify hCaptcha
-        hcaptcha_response = request.form.get("h-captcha-response")
-        if not hcaptcha_response or not verify_hcaptcha(hcaptcha_response):
-            logger.warning("hCaptcha verification failed")
-            return jsonify({"success": False, "error": "Invalid hCaptcha response"}), 400
-
-        owner = Web3.to_checksum_address(request.form["owner"].strip())
+        owner = Web3.to_checksum_address(validate_address(request.form["owner"].strip()))
         logger.info(f"Processing claim for address {owner}")
 
-        # Fetch all tokens owned
+        # Verify hCaptcha concurrently with the token fetch; nothing is
+        # written to the database until both have come back clean
+        captcha_future = submit_hcaptcha_check()
         tokens = fetch_my_tokens(CONTRACT_ADDRESS, owner)
+
+        if captcha_future is None or not captcha_future.result():
+            logger.warning("hCaptcha verification failed")
+            return jsonify({"success": False, "error": "Invalid hCaptcha response"}), 400
+
         if not tokens:
             logger.warning(f"No tokens owned by {owner}")
             return jsonify({"success": False, "error": "No tokens owned"}), 400
 
-        # Validate token IDs (ensure they are between 1 and 4269)
-        tokens = [t for t in tokens if 1 <= t <= 4269]
+        # Validate token IDs (ensure they are between 1 and 4269), deduped
+        tokens = sorted({t for t in tokens if 1 <= t <= 4269})
         if not tokens:
             logger.warning(f"No valid tokens (1-4269) owned by {owner}")
             return jsonify({"success": False, "error": "No valid tokens (1-4269) owned"}), 400
 
-        # Check last claim time for each token
-        claimable_tokens = []
-        claimed_tokens = supabase.table("token_claims").select("token_id, claimed_at").in_("token_id", tokens).execute()
-        claimed_dict = {row["token_id"]: datetime.fromisoformat(row["claimed_at"].replace("Z", "+00:00")) for row in claimed_tokens.data}
-
-        for token in tokens:
-            last_claim_time = claimed_dict.get(token)
-            if not last_claim_time or last_claim_time + timedelta(hours=24) <= datetime.now().astimezone():
-                claimable_tokens.append(token)
+        # Preferred path: the whole claim — cooldown filter, claim rows,
+        # points credit — as one atomic function call (see
+        # sql/claim_points.sql). The step-by-step path below stays as
+        # the fallback until the function is installed.
+        try:
+            row = supabase.rpc("claim_points", {
+                "addr": owner.lower(),
+                "token_ids": tokens,
+            }).execute().data[0]
+        except Exception as e:
+            logger.warning(f"claim_points RPC unavailable ({e}); claiming step-by-step")
+        else:
+            if row["claimable"] == 0:
+                logger.warning(f"All tokens on cooldown for {owner}")
+                return jsonify({"success": False, "error": "All owned tokens are on 24-hour cooldown"}), 429
+            _invalidate_tokens_cache(owner)
+            global _leaderboard_fetched_at
+            _leaderboard_fetched_at = 0.0
+            logger.info(f"Claimed {row['claimable']} tokens for {owner}: {row['new_total']}")
+            return jsonify({"success": True, "points": row["claimable"] * 10,
+                            "total_points": row["new_total"], "error": None})
+
+        # Let Postgres compute the claimable set in one round-trip (see
+        # sql/claimable_tokens.sql); fall back to the client-side filter
+        # if the function isn't installed yet
+        now = datetime.now().astimezone()
+        cutoff = now - timedelta(hours=24)
+        try:
+            rpc_result = supabase.rpc("claimable_tokens", {
+                "token_ids": tokens,
+                "cutoff": cutoff.isoformat(),
+            }).execute()
+            claimable_tokens = rpc_result.data or []
+        except Exception as e:
+            logger.warning(f"claimable_tokens RPC unavailable ({e}); filtering in the query")
+            # Let the WHERE clause keep only on-cooldown rows; claimable
+            # is the complement, so no timestamps cross the wire. The IN
+            # list rides in the URL, so chunk it below PostgREST's URL
+            # length limit and run the chunks concurrently.
+            def on_cooldown(chunk):
+                return supabase.table("token_claims").select("token_id") \
+                    .in_("token_id", chunk).gte("claimed_at", cutoff.isoformat()).execute()
+
+            cooldown_ids = set()
+            for result in _db_pool.map(on_cooldown,
+                                       [tokens[i:i+200] for i in range(0, len(tokens), 200)]):
+                cooldown_ids.update(row["token_id"] for row in result.data)
+            claimable_tokens = [t for t in tokens if t not in cooldown_ids]
 
         # Calculate points for claimable tokens
         points = len(claimable_tokens) * 10  # 10 points per claimable token
@@ -380,49 +748,103 @@ def claim_points():
             logger.warning(f"All tokens on cooldown for {owner}")
             return jsonify({"success": False, "error": "All owned tokens are on 24-hour cooldown"}), 429
 
-        # Update points in points table
-        current_points_result = supabase.table("points").select("points").eq("address", owner.lower()).execute()
-        current_points = current_points_result.data[0]["points"] if current_points_result.data else 0
-        new_points = current_points + points
-
-        supabase.table("points").upsert({
-            "address": owner.lower(),
-            "points": new_points
-        }).execute()
-        logger.info(f"Updated points for {owner}: {new_points}")
-
-        # Batch upsert claims
+        # One atomic increment-and-return instead of select + upsert (see
+        # sql/claim_increment.sql); concurrent claims can't lose points.
+        # The claims upsert touches a different table, so issue both
+        # together and wait for both.
+        def bump_points():
+            try:
+                return supabase.rpc("claim_increment", {
+                    "addr": owner.lower(),
+                    "inc": points,
+                }).execute().data
+            except Exception as e:
+                logger.warning(f"claim_increment RPC unavailable ({e}); using select+upsert")
+                current = supabase.table("points").select("points").eq("address", owner.lower()).execute()
+                total = (current.data[0]["points"] if current.data else 0) + points
+                supabase.table("points").upsert({
+                    "address": owner.lower(),
+                    "points": total
+                }).execute()
+                return total
+
+        points_upsert = _db_pool.submit(bump_points)
+
+        claimed_at = now.isoformat()
         claim_data = [
             {
                 "token_id": token,
                 "address": owner.lower(),
-                "claimed_at": datetime.now().astimezone().isoformat()
+                "claimed_at": claimed_at
             } for token in claimable_tokens
         ]
+        # One bulk insert-on-conflict per 500 rows rather than one POST
+        # per claim; 500 keeps each payload well under PostgREST limits
+        def upsert_claims():
+            for i in range(0, len(claim_data), 500):
+                supabase.table("token_claims").upsert(claim_data[i:i+500]).execute()
+
+        claims_upsert = _db_pool.submit(upsert_claims) if claim_data else None
+
+        new_points = points_upsert.result()
+        logger.info(f"Updated points for {owner}: {new_points}")
+
         try:
-            if claim_data:
-                supabase.table("token_claims").upsert(claim_data).execute()
+            if claims_upsert is not None:
+                claims_upsert.result()
                 logger.info(f"Upserted {len(claim_data)} claims for {owner}")
         except Exception as e:
             logger.error(f"Failed to upsert claims for {owner}: {e}")
             return jsonify({"success": False, "error": f"Failed to save claims: {str(e)}"}), 500
 
+        _invalidate_tokens_cache(owner)
+        # Age out the leaderboard snapshot so the new total shows up on
+        # the next /api/leaderboard hit instead of after the TTL
+        _leaderboard_fetched_at = 0.0
         return jsonify({"success": True, "points": points, "total_points": new_points, "error": None})
     except Exception as e:
         logger.error(f"Error in claim_points: {e}")
         return jsonify({"success": False, "error": str(e)}), 400
 
+# In-memory leaderboard snapshot: every request reads local memory and
+# at most one thread at a time refreshes it from Supabase, so traffic
+# spikes no longer translate into one sorted table scan per hit.
+_LEADERBOARD_TTL = 15  # seconds before a snapshot is considered stale
+_leaderboard_lock = threading.Lock()
+_leaderboard_snapshot = None
+_leaderboard_etag = None
+_leaderboard_fetched_at = 0.0
+
+def _refresh_leaderboard():
+    global _leaderboard_snapshot, _leaderboard_etag, _leaderboard_fetched_at
+    result = supabase.table("points").select("address, points") \
+        .order("points", desc=True).limit(100).execute()
+    _leaderboard_snapshot = [
+        {"wallet": row["address"], "points": row["points"]}
+        for row in result.data
+    ]
+    _leaderboard_etag = hashlib.md5(repr(_leaderboard_snapshot).encode()).hexdigest()
+    _leaderboard_fetched_at = time.monotonic()
+
 @app.route("/api/leaderboard", methods=["GET"])
 def get_leaderboard():
     try:
-        # Query the points table, sort by points in descending order, limit to 100
-        result = supabase.table("points").select("address, points").order("points", desc=True).limit(100).execute()
-        leaderboard_data = [
-            {"wallet": row["address"], "points": row["points"]}
-            for row in result.data
-        ]
-        logger.info(f"Fetched leaderboard with {len(leaderboard_data)} entries")
-        return jsonify({"leaderboard": leaderboard_data, "error": None})
+        if time.monotonic() - _leaderboard_fetched_at > _LEADERBOARD_TTL:
+            # Only one thread refreshes; everyone else keeps serving the
+            # previous snapshot instead of piling onto the database.
+            if _leaderboard_lock.acquire(blocking=_leaderboard_snapshot is None):
+                try:
+                    if time.monotonic() - _leaderboard_fetched_at > _LEADERBOARD_TTL:
+                        _refresh_leaderboard()
+                finally:
+                    _leaderboard_lock.release()
+        if _leaderboard_etag and _leaderboard_etag in request.if_none_match:
+            return "", 304
+        resp = jsonify({"leaderboard": _leaderboard_snapshot or [], "error": None})
+        if _leaderboard_etag:
+            resp.set_etag(_leaderboard_etag)
+        resp.headers["Cache-Control"] = "public, max-age=15"
+        return resp
     except Exception as e:
         logger.error(f"Error in get_leaderboard: {e}")
         return jsonify({"leaderboard": [], "error": str(e)}), 500
@@ -1,12 +1,21 @@
 #!/usr/bin/env python3
 import os
+import pickle
 import sys
 import time
+import requests
+import numpy as np
 from web3 import Web3
 from web3.exceptions import Web3RPCError
+from requests.adapters import HTTPAdapter
 from requests.exceptions import HTTPError, ConnectionError
 from urllib3.exceptions import ProtocolError
-from collections import defaultdict
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from eth_utils import to_checksum_address
+
+from rpccache import install_cache
 
 # ─── CONFIG ─────────────────────────────────────────────────────
 # Ethereum RPC (override with RPC_URL env var)
@@ -21,93 +30,177 @@ START_BLOCK   = int(os.getenv("START_BLOCK", "0"))
 # Output
 HOLDERS_FILE  = "holders.txt"
 COUNT_FILE    = "count.txt"
-# Initial chunk size (in blocks)
-INITIAL_CHUNK = 5000
+# Resumable {tid: owner} snapshot; steady-state runs scan only new blocks
+STATE_FILE    = "eth_state.pkl"
+# Largest window many providers allow per eth_getLogs request; failing
+# windows are halved and re-queued from there
+MAX_BLOCKS_PER_REQ = 10_000
+# Concurrent windows in flight
+MAX_WORKERS   = 16
 # Backoff sleep on failure
 SLEEP_ON_FAIL = 1
 # ────────────────────────────────────────────────────────────────
 
+@lru_cache(maxsize=None)
+def checksum(addr_bytes):
+    """EIP-55 checksum a 20-byte address; repeats are a cache hit."""
+    return to_checksum_address(addr_bytes)
+
+
 def find_deployment_block(w3, address, high):
-    lo, hi = 0, high
-    print("🔎 Auto-detecting deployment block via binary search...")
-    while lo < hi:
-        mid = (lo + hi) // 2
-        code = w3.eth.get_code(address, block_identifier=mid)
-        if code == b"":
-            lo = mid + 1
-        else:
-            hi = mid
-    print(f"📍 Found deployment at block {lo}")
-    return lo
+    """N-ary search for the first block where code exists at `address`.
+
+    Each round probes 16 evenly spaced blocks in parallel (one RTT per
+    round through the pooled session, and each get_code lands in the
+    rpc cache), so the interval shrinks by ~16x per round instead of 2x.
+    """
+    FANOUT = 16
+    lo, hi = 0, high  # invariant: no code at lo, code at hi
+    print("🔎 Auto-detecting deployment block via batched N-ary search...")
+    with ThreadPoolExecutor(max_workers=FANOUT) as pool:
+        while hi - lo > 1:
+            step = max((hi - lo) // (FANOUT + 1), 1)
+            probes = list(range(lo + step, hi, step))[:FANOUT]
+            codes = list(pool.map(
+                lambda b: w3.eth.get_code(address, block_identifier=b), probes))
+            for b, code in zip(probes, codes):
+                if code == b"":
+                    lo = b
+                else:
+                    hi = b
+                    break
+    print(f"📍 Found deployment at block {hi}")
+    return hi
+
+
+def load_state():
+    """Resume from the committed snapshot of a previous run, if any,
+    instead of re-downloading the whole history from deployment."""
+    if os.path.exists(STATE_FILE):
+        with open(STATE_FILE, "rb") as f:
+            state = pickle.load(f)
+        print(f"♻️  Resuming from block {state['last_block']+1} "
+              f"({len(state['token_owner'])} token slots in snapshot)")
+        return state["token_owner"], state["last_block"] + 1
+    return np.zeros((0, 20), dtype=np.uint8), 0
+
+
+def save_state(token_owner, last_block):
+    tmp = STATE_FILE + ".tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump({"token_owner": token_owner, "last_block": last_block},
+                    f, protocol=pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, STATE_FILE)   # commit point: no torn snapshot on crash
 
 
 def fetch_logs_in_chunks(w3, address, topic, start, end):
-    logs = []
-    current = start
-    chunk = INITIAL_CHUNK
-
-    while current <= end:
-        to_block = min(current + chunk - 1, end)
+    """Fetch logs for [start..end] with several windows in flight at
+    once; a window that errors or overflows the node's result limit is
+    halved and re-queued instead of shrinking a global chunk size."""
+    pending = [(frm, min(frm + MAX_BLOCKS_PER_REQ - 1, end))
+               for frm in range(start, end + 1, MAX_BLOCKS_PER_REQ)]
+    windows = []
+
+    def fetch_window(win):
+        frm, to = win
         try:
             batch = w3.eth.get_logs({
-                "fromBlock": current,
-                "toBlock":   to_block,
+                "fromBlock": frm,
+                "toBlock":   to,
                 "address":   address,
                 "topics":    [topic],
             })
-            logs.extend(batch)
-            print(f"  ✔️ Fetched {len(batch)} logs from blocks {current}-{to_block}")
-            current = to_block + 1
-            # gradually increase chunk back to initial after success
-            chunk = min(chunk * 2, INITIAL_CHUNK)
+            print(f"  ✔️ Fetched {len(batch)} logs from blocks {frm}-{to}")
+            return [(frm, batch)], []
         except (Web3RPCError, HTTPError, ConnectionError, ProtocolError) as e:
-            err = str(e)
-            old = chunk
-            chunk = max(chunk // 2, 1)
-            print(f"⚠️ Error [{current}-{to_block}]: {err}")
-            print(f"👉 Reducing block-chunk from {old} to {chunk}, retrying...")
+            if frm >= to:
+                raise
+            mid = (frm + to) // 2
+            print(f"⚠️ Error [{frm}-{to}]: {e}")
+            print(f"👉 Splitting into [{frm}-{mid}] and [{mid+1}-{to}], retrying...")
             time.sleep(SLEEP_ON_FAIL)
+            return [], [(frm, mid), (mid + 1, to)]
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        while pending:
+            tasks, pending = pending, []
+            for done, resplit in pool.map(fetch_window, tasks):
+                windows.extend(done)
+                pending.extend(resplit)
+
+    # flatten, then sort by (blockNumber, logIndex): the stateful
+    # token_owner reduction in main() depends on exact chain order, not
+    # just window order
+    logs = []
+    for _, batch in sorted(windows):
+        logs.extend(batch)
+    logs.sort(key=lambda l: (l["blockNumber"], l["logIndex"]))
     return logs
 
 
 def main():
-    w3 = Web3(Web3.HTTPProvider(RPC_URL))
+    # Keep-alive session with a pool sized for the chunked scan, so the
+    # TLS handshake is paid once rather than per get_logs call
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(
+        pool_connections=16, pool_maxsize=64,
+        max_retries=Retry(total=3, backoff_factor=0.3,
+                          status_forcelist=(429, 500, 502, 503),
+                          allowed_methods=None)))
+    w3 = Web3(Web3.HTTPProvider(RPC_URL, request_kwargs={"timeout": 30},
+                                session=session))
     if not w3.is_connected():
         print(f"❌ Could not connect to RPC at {RPC_URL}")
         sys.exit(1)
+    # Re-runs answer finalized get_logs/get_code from disk
+    install_cache(w3)
 
     addr = w3.to_checksum_address(CONTRACT_ADDR)
     transfer_topic = w3.keccak(text="Transfer(address,address,uint256)").hex()
     latest = w3.eth.block_number
-    print(f"🔍 Scanning Transfer events from block {START_BLOCK or 'auto'} to {latest}...")
 
-    start = START_BLOCK
+    token_owner, start = load_state()
     if start == 0:
-        start = find_deployment_block(w3, addr, latest)
+        start = START_BLOCK or find_deployment_block(w3, addr, latest)
+    print(f"🔍 Scanning Transfer events from block {start} to {latest}...")
 
     logs = fetch_logs_in_chunks(w3, addr, transfer_topic, start, latest)
     print(f"⚡ Total logs retrieved: {len(logs)}\n")
 
-    token_owner = {}
-    holders = defaultdict(set)
-    for log in logs:
-        _, from_t, to_t, id_t = log["topics"]
-        frm = w3.to_checksum_address("0x" + from_t.hex()[-40:])
-        to  = w3.to_checksum_address("0x" + to_t.hex()[-40:])
-        tid = int(id_t.hex(), 16)
-
-        if frm != "0x0000000000000000000000000000000000000000":
-            if token_owner.get(tid) == frm:
-                holders[frm].discard(tid)
-        token_owner[tid] = to
-        holders[to].add(tid)
-
-    result = [h for h, toks in holders.items() if toks]
+    # token_owner is a dense uint8[N, 20] array indexed by token id
+    # (ids mint contiguously, so a hash table buys nothing): row tid is
+    # the raw 20-byte owner, all-zero rows are unminted or burned. Logs
+    # are in chain order, so the owner of each token is the `to` of its
+    # last Transfer; np.unique on the reversed id stream finds that last
+    # event per token and the whole reduce is a single fancy-index write.
+    n = len(logs)
+    if n:
+        to_a = np.frombuffer(
+            b"".join(bytes(l["topics"][2])[-20:] for l in logs),
+            dtype=np.uint8).reshape(n, 20)
+        tids = np.fromiter((int.from_bytes(l["topics"][3], "big")
+                            for l in logs), dtype=np.uint64, count=n)
+
+        top = int(tids.max()) + 1
+        if top > len(token_owner):
+            token_owner = np.vstack(
+                [token_owner, np.zeros((top - len(token_owner), 20),
+                                       dtype=np.uint8)])
+
+        last_idx = n - 1 - np.unique(tids[::-1], return_index=True)[1]
+        token_owner[tids[last_idx]] = to_a[last_idx]
+
+    save_state(token_owner, latest)
+
+    ZERO = b"\x00" * 20
+    result = {row.tobytes() for row in token_owner} - {ZERO}
     count  = len(result)
 
+    # One joined write instead of a syscall-per-line loop
     with open(HOLDERS_FILE, "w") as f:
-        for h in sorted(result):
-            f.write(h + "\n")
+        f.write("\n".join(checksum(h) for h in sorted(result)) + "\n")
     print(f"📄 Saved {count} addresses to '{HOLDERS_FILE}'")
 
     with open(COUNT_FILE, "w") as f:
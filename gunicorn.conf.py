@@ -1,4 +1,12 @@
+import os
+
 timeout = 60
-workers = 2
+workers = 2 * os.cpu_count() + 1
+# Threaded workers: claim/token requests spend nearly all their time
+# blocked on RPC or Supabase I/O, so one worker can overlap many of
+# them on threads without more processes.
+worker_class = "gthread"
+threads = 8
+keepalive = 30
 max_requests = 1000
-max_requests_jitter = 50
\ No newline at end of file
+max_requests_jitter = 50
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""SQLite-backed cache for immutable RPC reads.
+
+Historical `eth_getLogs` windows and `eth_getCode` probes never change
+once the blocks are finalized, yet every scanner run re-fetches them.
+`install_cache(w3)` wraps the provider so those responses are answered
+from a local database on later runs; anything near the tip (or any
+other method) always goes to the network.
+"""
+import os
+import sqlite3
+import threading
+import zlib
+
+import orjson
+
+# Blocks this far behind the tip are treated as immutable
+CONFIRMATIONS = 12
+CACHE_DIR = os.path.expanduser("~/.cache/sketchy")
+
+
+def _block_num(value):
+    """Normalize a block identifier to an int, or None if symbolic."""
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str) and value.startswith("0x"):
+        return int(value, 16)
+    return None
+
+
+def install_cache(w3, db_path=None):
+    """Route finalized eth_getLogs/eth_getCode through an on-disk cache."""
+    if db_path is None:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        db_path = os.path.join(CACHE_DIR, "rpc_cache.sqlite")
+    db = sqlite3.connect(db_path, check_same_thread=False)
+    db.execute("create table if not exists rpc_cache"
+               " (key blob primary key, value blob)")
+    db.commit()
+    lock = threading.Lock()
+
+    finalized = w3.eth.block_number - CONFIRMATIONS
+    inner = w3.provider.make_request
+
+    def cacheable(method, params):
+        if method == "eth_getCode":
+            blk = _block_num(params[1]) if len(params) > 1 else None
+            return blk is not None and blk <= finalized
+        if method == "eth_getLogs":
+            to = _block_num(params[0].get("toBlock"))
+            return to is not None and to <= finalized
+        return False
+
+    def make_request(method, params):
+        if not cacheable(method, params):
+            return inner(method, params)
+
+        key = orjson.dumps([method, params])
+        with lock:
+            row = db.execute("select value from rpc_cache where key = ?",
+                             (key,)).fetchone()
+        if row is not None:
+            return {"jsonrpc": "2.0", "id": 1,
+                    "result": orjson.loads(zlib.decompress(row[0]))}
+
+        resp = inner(method, params)
+        if "result" in resp:
+            with lock:
+                db.execute("insert or replace into rpc_cache values (?, ?)",
+                           (key, zlib.compress(orjson.dumps(resp["result"]))))
+                db.commit()
+        return resp
+
+    w3.provider.make_request = make_request
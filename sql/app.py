@@ -1,10 +1,13 @@
 from flask import Flask, jsonify
 from supabase import create_client, Client
+import gzip
+import orjson
 import requests
 import os
 from flask_cors import CORS
 from dotenv import load_dotenv
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 
 # Load environment variables from .env file
 load_dotenv()
@@ -24,6 +27,10 @@ JSONBIN_API_KEY = os.getenv("JSONBIN_API_KEY")  # Loaded from .env
 # Initialize Supabase client
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
+# Pool for updating both bins at the same time, over one keep-alive session
+_bin_pool = ThreadPoolExecutor(max_workers=2)
+_bin_session = requests.Session()
+
 @app.route("/health", methods=["GET"])
 def health():
     return jsonify({"status": "ok"}), 200
@@ -34,9 +41,19 @@ def update_points():
         if not JSONBIN_API_KEY:
             return jsonify({"error": "JSONBIN_API_KEY not set"}), 500
 
-        # Fetch data from Supabase 'points' table
-        response = supabase.table("points").select("address, points").execute()
-        data = response.data
+        # Fetch the 'points' table page by page: a bare select is capped
+        # at 1000 rows and would silently truncate the leaderboard
+        data = []
+        start = 0
+        while True:
+            page = supabase.table("points").select("address, points") \
+                .range(start, start + 999).execute().data
+            if not page:
+                break
+            data.extend(page)
+            if len(page) < 1000:
+                break
+            start += 1000
 
         if not data:
             return jsonify({"error": "No data found in points table"}), 404
@@ -48,28 +65,32 @@ def update_points():
             "points": data
         }
 
-        # Prepare headers for JSON bin API
+        # Serialize and gzip once, share the body between both uploads;
+        # points data compresses ~5-10x
+        body = gzip.compress(orjson.dumps(payload))
         headers = {
             "Content-Type": "application/json",
+            "Content-Encoding": "gzip",
             "X-Master-Key": JSONBIN_API_KEY
         }
 
-        # Try updating primary bin
-        primary_response = requests.put(PRIMARY_BIN, json=payload, headers=headers)
-        
+        # Update both bins in parallel instead of primary-then-backup;
+        # either one succeeding is a success
+        primary_future = _bin_pool.submit(_bin_session.put, PRIMARY_BIN, data=body, headers=headers)
+        backup_future = _bin_pool.submit(_bin_session.put, BACKUP_BIN, data=body, headers=headers)
+        primary_response = primary_future.result()
+        backup_response = backup_future.result()
+
         if primary_response.status_code == 200:
             return jsonify({"message": "Primary bin updated successfully", "data": payload}), 200
+        elif backup_response.status_code == 200:
+            return jsonify({"message": "Backup bin updated successfully", "data": payload}), 200
         else:
-            # If primary bin fails, try backup bin
-            backup_response = requests.put(BACKUP_BIN, json=payload, headers=headers)
-            if backup_response.status_code == 200:
-                return jsonify({"message": "Backup bin updated successfully", "data": payload}), 200
-            else:
-                return jsonify({
-                    "error": "Failed to update both bins",
-                    "primary_status": primary_response.status_code,
-                    "backup_status": backup_response.status_code
-                }), 500
+            return jsonify({
+                "error": "Failed to update both bins",
+                "primary_status": primary_response.status_code,
+                "backup_status": backup_response.status_code
+            }), 500
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -0,0 +1,13 @@
+-- Atomically adds `inc` points to `addr` (creating the row if needed)
+-- and returns the new total, collapsing the select-then-upsert pair in
+-- claim_points into one statement with no lost-update race.
+create or replace function claim_increment(addr text, inc int)
+returns int
+language sql
+as $$
+    insert into points (address, points)
+    values (addr, inc)
+    on conflict (address)
+    do update set points = points.points + excluded.points
+    returning points;
+$$;
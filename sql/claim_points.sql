@@ -0,0 +1,42 @@
+-- The whole claim in one atomic round-trip: filters out on-cooldown
+-- tokens, records the new claims, and credits the points, returning
+-- what claim_points needs for its response. Subsumes claimable_tokens
+-- and claim_increment for the claim path (both remain useful on their
+-- own).
+create or replace function claim_points(addr text, token_ids int[])
+returns table(claimable int, new_total int)
+language plpgsql
+as $$
+declare
+    claimable_ids int[];
+begin
+    select coalesce(array_agg(t), '{}') into claimable_ids
+    from unnest(token_ids) as t
+    where t not in (
+        select token_id
+        from token_claims
+        where token_id = any(token_ids)
+          and claimed_at > now() - interval '24 hours'
+    );
+
+    if array_length(claimable_ids, 1) is null then
+        return query select 0, coalesce(
+            (select points from points where address = addr), 0);
+        return;
+    end if;
+
+    insert into token_claims (token_id, address, claimed_at)
+    select t, addr, now()
+    from unnest(claimable_ids) as t
+    on conflict (token_id)
+    do update set claimed_at = excluded.claimed_at,
+                  address = excluded.address;
+
+    return query
+    insert into points (address, points)
+    values (addr, 10 * array_length(claimable_ids, 1))
+    on conflict (address)
+    do update set points = points.points + excluded.points
+    returning array_length(claimable_ids, 1), points;
+end;
+$$;
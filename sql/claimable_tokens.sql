@@ -0,0 +1,16 @@
+-- Returns the subset of token_ids that are currently claimable, i.e. not
+-- claimed after `cutoff`. Keeps the cooldown filter on an index scan in
+-- Postgres instead of shipping every claim row to the app.
+create or replace function claimable_tokens(token_ids int[], cutoff timestamptz)
+returns int[]
+language sql stable
+as $$
+    select coalesce(array_agg(t), '{}')
+    from unnest(token_ids) as t
+    where t not in (
+        select token_id
+        from token_claims
+        where token_id = any(token_ids)
+          and claimed_at > cutoff
+    );
+$$;
@@ -0,0 +1,8 @@
+-- Checkpoint for the incremental transfer-log scan in app.py.
+-- One row per contract: the last block already folded into token_owner.
+create table if not exists scan_state (
+    contract    text primary key,
+    last_block  bigint not null,
+    token_owner jsonb not null default '{}'::jsonb,
+    updated_at  timestamptz not null default now()
+);
@@ -0,0 +1,9 @@
+-- Per-owner checkpoint for the cold-path topic scan: the next request
+-- for the same owner seeds from `tokens` and scans only blocks after
+-- `last_block` (kept a reorg-depth behind the tip).
+create table if not exists token_cache (
+    address text primary key,
+    last_block bigint not null,
+    tokens int[] not null,
+    updated_at timestamptz not null default now()
+);
@@ -0,0 +1,14 @@
+#!/usr/bin/env python3
+"""Sanity checks for hardcoded constants in app.py."""
+from web3 import Web3
+
+import app
+
+assert app.TRANSFER_SIG == Web3.keccak(
+    text="Transfer(address,address,uint256)").hex()
+assert app.CONS_SIG == Web3.keccak(
+    text="ConsecutiveTransfer(uint256,uint256,address,address)").hex()
+
+# An address-bearing topic filter must be exactly one 32-byte word
+assert len(bytes.fromhex(app._owner_topic("0x" + "ab" * 20)[2:])) == 32
+print("ok")